@@ -1,18 +1,35 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import asyncio
+import functools
+import heapq
+import html as html_lib
 import json
 import os
 import re
+import shutil
+from collections import Counter
 from datetime import datetime
+from io import StringIO, TextIOWrapper
 from zoneinfo import ZoneInfo
 from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from playwright.sync_api import sync_playwright
+from playwright.async_api import Browser, BrowserContext, Page, async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+try:
+    import orjson
+except ImportError:  # 沒裝 orjson 時退回標準庫 json
+    orjson = None
 
 
 TZ = ZoneInfo("Asia/Taipei")
@@ -28,44 +45,196 @@ SOURCES_PATH = os.path.join(ROOT, "scripts", "sources.json")
 OUT_CURRENT_DIR = os.path.join(ROOT, "docs", "data", "current")
 OUT_CHANGES_DIR = os.path.join(ROOT, "docs", "data", "changes")
 OUT_SNAP_DIR = os.path.join(ROOT, "docs", "data", "snapshots")
+CACHE_DIR = os.path.join(ROOT, "docs", "data", "_cache")
+
+# 各來源共用連線（keep-alive）；Accept-Encoding 沿用 requests 預設（gzip/deflate，有裝 brotli 時含 br）
+_SESSION = requests.Session()
+_SESSION.headers.update({"User-Agent": UA})
+_ADAPTER = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=Retry(total=3, backoff_factor=0.5))
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+# 支援：YYYY/MM/DD 或 YYYY-MM-DD
+_DATE_RE = re.compile(r"(資料日期|日期|Data\s*Date)\s*[:：]?\s*(\d{4}[/-]\d{2}[/-]\d{2})", re.IGNORECASE)
+
+# XHTML 開頭的 <?xml ... encoding=...?>；lxml 不接受帶編碼宣告的 str，解析前先去掉
+_XML_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+# Content-Type 裡明確宣告的 charset
+_CHARSET_RE = re.compile(r"charset\s*=\s*[\"']?([^\"';\s]+)", re.IGNORECASE)
+
+# 數字欄位要去掉的千分位、百分比符號與空白（build_map 整欄使用）
+_WEIGHT_NOISE_RE = re.compile(r"[,%\s]")
+_SHARES_NOISE_RE = re.compile(r"[,\s]")
+
+# pick_holdings_table 用來辨識持股表的表頭關鍵字
+HOLDINGS_KEYWORD_SETS = (
+    ("代號", "名稱", "比重"),
+    ("股票代號", "股票名稱", "比重"),
+    ("Ticker", "Name", "Weight"),
+    ("代碼", "名稱", "權重"),
+)
+
+# detect_columns 的候選欄名（依優先順序），以及模糊比對用的小寫版本
+COLUMN_CANDIDATES = {
+    "code": ("股票代號", "證券代號", "代號", "代碼", "Ticker", "Symbol"),
+    "name": ("股票名稱", "證券名稱", "名稱", "Name", "Security"),
+    "weight": ("比重(%)", "比重", "權重(%)", "權重", "Weight", "持股權重"),
+    "shares": ("股數", "持有股數", "持股股數", "Shares", "Units", "數量"),
+}
+_COLUMN_CANDIDATES_LOWER = {
+    field: tuple(k.lower().replace("(%)", "") for k in cands) for field, cands in COLUMN_CANDIDATES.items()
+}
+
+# 同時開啟的分頁上限（各來源之間平行抓取）
+MAX_CONCURRENT_PAGES = 4
 
 
 def ensure_dir(p: str) -> None:
     os.makedirs(p, exist_ok=True)
 
 
-def _html_text(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
-    return soup.get_text(" ", strip=True)
+def _html_text(doc: lxml_html.HtmlElement) -> str:
+    # 只為了找資料日期，直接取 lxml 樹上的文字節點（略過 script/style）
+    texts = doc.xpath("//text()[not(ancestor::script) and not(ancestor::style)]")
+    return " ".join(t.strip() for t in texts if t.strip())
 
 
 def extract_date_from_text(text: str) -> Optional[str]:
-    # 支援：YYYY/MM/DD 或 YYYY-MM-DD
-    m = re.search(r"(資料日期|日期|Data\s*Date)\s*[:：]?\s*(\d{4}[/-]\d{2}[/-]\d{2})", text, re.IGNORECASE)
+    m = _DATE_RE.search(text)
     if m:
         return m.group(2).replace("-", "/")
     return None
 
 
-def pick_holdings_table(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+def pick_holdings_table(tables: List[lxml_html.HtmlElement]) -> lxml_html.HtmlElement:
     # 用關鍵欄位挑「持股明細」：包含「代號/名稱/比重/股數」等其一，再以列數最大為主
-    keyword_sets = [
-        ["代號", "名稱", "比重"],
-        ["股票代號", "股票名稱", "比重"],
-        ["Ticker", "Name", "Weight"],
-        ["代碼", "名稱", "權重"],
-    ]
-
-    def score(df: pd.DataFrame) -> int:
-        cols = " ".join([str(c) for c in df.columns])
+    def score(table: lxml_html.HtmlElement) -> int:
+        # 表頭：thead 內的格子，或各列的 th
+        header = table.xpath(".//thead//th | .//thead//td | .//tr/th")
+        cols = " ".join(c.text_content().strip() for c in header)
         s = 0
-        for ks in keyword_sets:
+        for ks in HOLDINGS_KEYWORD_SETS:
             hit = sum(1 for k in ks if k in cols)
             s = max(s, hit)
         # rows/cols also matter
-        return s * 100000 + df.shape[0] * 100 + df.shape[1]
+        trs = table.xpath(".//tr")
+        n_cols = max((len(tr.xpath("./td | ./th")) for tr in trs), default=0)
+        return s * 100000 + len(trs) * 100 + n_cols
+
+    return max(tables, key=score)
+
+
+def _parse_html_doc(html: str) -> lxml_html.HtmlElement:
+    return lxml_html.fromstring(_XML_DECL_RE.sub("", html, count=1))
+
+
+def parse_html_holdings(html: str) -> Tuple[Optional[str], pd.DataFrame]:
+    # 只解析一次 DOM，挑出持股表後才交給 pandas，其餘表格不建 DataFrame
+    doc = _parse_html_doc(html)
+    data_date = extract_date_from_text(_html_text(doc))
+
+    tables = doc.xpath("//table")
+    if not tables:
+        raise ValueError("No tables found")
+    table = pick_holdings_table(tables)
+    df = pd.read_html(StringIO(etree.tostring(table, encoding="unicode")))[0]
+    return data_date, normalize_df(df)
+
+
+def _select(el: lxml_html.HtmlElement, selector: str) -> List[lxml_html.HtmlElement]:
+    # 以 / 或 ( 開頭視為 XPath，其餘當 CSS selector
+    if selector.startswith(("/", "./", "(")):
+        return el.xpath(selector)
+    return el.cssselect(selector)
+
+
+def _header_columns(header_rows: List[lxml_html.HtmlElement]) -> List[str]:
+    # 展開多列表頭的 rowspan/colspan，每欄取最下層那一格的文字當欄名
+    grid: Dict[Tuple[int, int], str] = {}
+    for r, tr in enumerate(header_rows):
+        c = 0
+        for cell in tr.xpath("./th | ./td"):
+            while (r, c) in grid:
+                c += 1
+            text = cell.text_content().strip()
+            rowspan = int(cell.get("rowspan") or 1)
+            colspan = int(cell.get("colspan") or 1)
+            for i in range(rowspan):
+                for j in range(colspan):
+                    grid[(r + i, c + j)] = text
+            c += colspan
+    last = len(header_rows) - 1
+    width = max((c + 1 for (r, c) in grid if r == last), default=0)
+    columns = [grid.get((last, c), "") for c in range(width)]
+
+    # 最下層欄名重複時（例如 前日/今日 底下各有 股數、比重），改用完整表頭路徑，例如「前日 股數」
+    counts = Counter(columns)
+    for c, name in enumerate(columns):
+        if counts[name] > 1:
+            path: List[str] = []
+            for r in range(last + 1):
+                text = grid.get((r, c), "")
+                if text and (not path or path[-1] != text):
+                    path.append(text)
+            columns[c] = " ".join(path)
+
+    # 路徑仍相同的欄位比照 pandas 加上 .1、.2 ...
+    seen: Dict[str, int] = {}
+    for c, name in enumerate(columns):
+        if name in seen:
+            seen[name] += 1
+            columns[c] = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+    return columns
+
+
+def parse_html_with_selectors(html: str, cfg: Dict[str, Any]) -> Tuple[Optional[str], List[str], List[Dict[str, Any]]]:
+    # sources.json 指定了 table_selector 時直接照欄位讀表，不經 pandas 與表格猜測
+    doc = _parse_html_doc(html)
+    data_date = extract_date_from_text(_html_text(doc))
+
+    tables = _select(doc, cfg["table_selector"])
+    if not tables:
+        raise ValueError(f"No table matches {cfg['table_selector']!r}")
+    table = tables[0]
+
+    header_rows = table.xpath("./thead/tr") or table.xpath("(.//tr[th])[1]")
+    if not header_rows:
+        raise ValueError(f"No header row in table {cfg['table_selector']!r}")
+    columns = _header_columns(header_rows)
+
+    if cfg.get("row_selector"):
+        trs = _select(table, cfg["row_selector"])
+    else:
+        trs = table.xpath("./tbody/tr[td] | ./tr[td]")
+    rows = []
+    for tr in trs:
+        if tr in header_rows:
+            continue
+        cells = [c.text_content().strip() or None for c in tr.xpath("./td | ./th")]
+        if len(cells) > len(columns):
+            raise ValueError(
+                f"Row has {len(cells)} cells but header has {len(columns)} columns in table {cfg['table_selector']!r}"
+            )
+        cells += [None] * (len(columns) - len(cells))
+        rows.append(dict(zip(columns, cells)))
+    return data_date, columns, rows
+
 
-    return max(dfs, key=score)
+def parse_html_source(html: str, cfg: Dict[str, Any]) -> Tuple[Optional[str], List[str], List[Dict[str, Any]]]:
+    if cfg.get("table_selector"):
+        return parse_html_with_selectors(html, cfg)
+    data_date, df = parse_html_holdings(html)
+    return data_date, list(df.columns), df.to_dict(orient="records")
+
+
+def column_map_from_cfg(cfg: Dict[str, Any]) -> Optional[Dict[str, Optional[str]]]:
+    # sources.json 以 code_col/name_col/weight_col/shares_col 指定的欄名；未指定的欄位為 None，比對時仍交給 detect_columns
+    if not any(cfg.get(f"{field}_col") for field in COLUMN_CANDIDATES):
+        return None
+    return {field: cfg.get(f"{field}_col") for field in COLUMN_CANDIDATES}
 
 
 def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
@@ -75,21 +244,91 @@ def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
     df = df.where(pd.notnull(df), None)
     return df
 
-def render_html_playwright(url: str, expand: bool = True) -> str:
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True, args=["--no-sandbox"])
-        context = browser.new_context(user_agent=UA, locale="zh-TW", timezone_id="Asia/Taipei")
-        page = context.new_page()
 
-        page.goto(url, wait_until="load", timeout=90000)
-        page.wait_for_timeout(6000)
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+
+
+async def _block_heavy_resources(route) -> None:
+    # 只需要 DOM 裡的表格，圖片/字型/影音/樣式一律不下載
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def launch_browser(p) -> Tuple[Browser, BrowserContext]:
+    # 整個執行過程共用一個 browser + context，避免每個來源都冷啟動 Chromium
+    browser = await p.chromium.launch(
+        headless=True,
+        args=["--no-sandbox", "--disable-dev-shm-usage", "--disable-gpu"],
+    )
+    context = await browser.new_context(user_agent=UA, locale="zh-TW", timezone_id="Asia/Taipei")
+    await context.route("**/*", _block_heavy_resources)
+    return browser, context
+
+
+async def wait_for_table(page: Page, ready_selector: Optional[str] = None) -> None:
+    # 等到表格出現且列已經填好（部分網站由 JS 補上資料列），逾時才退回固定等待
+    try:
+        await page.wait_for_selector(ready_selector or "table", state="attached", timeout=15000)
+        if ready_selector:
+            # 只數 ready_selector 範圍內的列，避免頁面上其他小表格先滿足條件
+            await page.wait_for_function(
+                "sel => Array.from(document.querySelectorAll(sel))"
+                ".reduce((n, el) => n + el.querySelectorAll('tr').length, 0) > 3",
+                arg=ready_selector,
+                timeout=20000,
+            )
+        else:
+            await page.wait_for_function("document.querySelectorAll('table tr').length > 3", timeout=20000)
+    except PlaywrightTimeoutError:
+        await page.wait_for_timeout(2000)
+
+
+# 在頁面內只取出文字（找資料日期用）與最外層 table 的 HTML，不把整頁 markup 傳回來；
+# 文字比照 _html_text 收 script/style 以外的所有 text node，隱藏元素裡的日期也要找得到
+_EXTRACT_TABLES_JS = """() => {
+    const parts = [];
+    if (document.body) {
+        const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT, {
+            acceptNode: n => n.parentElement && n.parentElement.closest("script, style")
+                ? NodeFilter.FILTER_REJECT
+                : NodeFilter.FILTER_ACCEPT,
+        });
+        for (let n = walker.nextNode(); n; n = walker.nextNode()) {
+            const t = n.textContent.trim();
+            if (t) parts.push(t);
+        }
+    }
+    return {
+        text: parts.join(" "),
+        tables: Array.from(document.querySelectorAll("table"))
+            .filter(t => !(t.parentElement && t.parentElement.closest("table")))
+            .map(t => t.outerHTML),
+    };
+}"""
+
+
+async def render_html_playwright(
+    context: BrowserContext,
+    url: str,
+    expand: bool = True,
+    ready_selector: Optional[str] = None,
+    tables_only: bool = True,
+) -> str:
+    # tables_only 時回傳只含頁面文字與表格的精簡 HTML；需要整頁結構（table_selector）時設為 False
+    page = await context.new_page()
+    pages = [page]
+    try:
+        await page.goto(url, wait_until="load", timeout=90000)
+        await wait_for_table(page, ready_selector)
 
         if expand:
             labels = ["查看更多", "看更多", "更多", "展開", "完整持股", "全部持股", "持股明細", "Portfolio"]
             for label in labels:
                 loc = page.locator(f"text={label}")
                 try:
-                    cnt = loc.count()
+                    cnt = await loc.count()
                 except Exception:
                     cnt = 0
                 if cnt == 0:
@@ -100,159 +339,162 @@ def render_html_playwright(url: str, expand: bool = True) -> str:
                     try:
                         # 新分頁
                         try:
-                            with context.expect_page(timeout=1500) as pop:
-                                el.click(timeout=1500)
-                            newp = pop.value
-                            newp.wait_for_load_state("load", timeout=30000)
-                            newp.wait_for_timeout(2500)
+                            async with context.expect_page(timeout=1500) as pop:
+                                await el.click(timeout=1500)
+                            newp = await pop.value
+                            pages.append(newp)
+                            await newp.wait_for_load_state("load", timeout=30000)
+                            await newp.wait_for_timeout(2500)
                             page = newp
                             break
                         except Exception:
                             pass
 
                         # 同頁展開/彈窗
-                        el.click(timeout=1500)
-                        page.wait_for_timeout(2500)
+                        await el.click(timeout=1500)
+                        await page.wait_for_timeout(2500)
                         break
                     except Exception:
                         continue
                 break
 
-        html = page.content()
-        context.close()
-        browser.close()
-        return html
-def fetch_holdings_from_source(cfg: Dict[str, Any]) -> Tuple[Optional[str], List[str], List[Dict[str, Any]]]:
-    typ = cfg.get("type", "playwright_html")
-    url = cfg["url"]
-
-    all_dfs: List[pd.DataFrame] = []
-    data_date: Optional[str] = None
-
-        if typ == "playwright_html":
-        html_list = render_html_playwright(url, expand=bool(cfg.get("expand", True)))
-
-        for html in html_list:
-            text = _html_text(html)
-            if data_date is None:
-                data_date = extract_date_from_text(text)
-            try:
-                dfs = pd.read_html(html)
-                all_dfs.extend(dfs)
-            except Exception:
-                continue
-
-        if not all_dfs:
-            raise RuntimeError("No tables found after rendering/expanding.")
-
-        df = normalize_df(pick_holdings_table(all_dfs))
-
-    elif typ == "html":
-        r = requests.get(url, headers={"User-Agent": UA}, timeout=60)
+        if not tables_only:
+            return await page.content()
+        extracted = await page.evaluate(_EXTRACT_TABLES_JS)
+        return "<html><body><p>{}</p>{}</body></html>".format(
+            html_lib.escape(extracted["text"]), "".join(extracted["tables"])
+        )
+    finally:
+        for pg in pages:
+            await pg.close()
+
+
+def validators_path(code: str) -> str:
+    return os.path.join(CACHE_DIR, f"{code}.etag.json")
+
+
+def conditional_headers(code: str, url: str) -> Dict[str, str]:
+    # 有上次的 ETag/Last-Modified 且有快照可沿用時，才送條件式請求；
+    # sources.json 換過 url 時舊的 validators 不適用於新網址
+    path = validators_path(code)
+    if not os.path.exists(path) or not list_snapshots(code, limit=1):
+        return {}
+    v = load_json(path)
+    if v.get("url") != url:
+        return {}
+    headers = {}
+    if v.get("etag"):
+        headers["If-None-Match"] = v["etag"]
+    if v.get("last_modified"):
+        headers["If-Modified-Since"] = v["last_modified"]
+    return headers
+
+
+def response_validators(r: requests.Response) -> Dict[str, str]:
+    v = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    return {k: x for k, x in v.items() if x}
+
+
+def load_latest_snapshot(code: str) -> Tuple[Optional[str], List[str], List[Dict[str, Any]]]:
+    # 來源回 304：沿用最新快照的內容，不再解析
+    snap = load_snapshot(list_snapshots(code, limit=1)[-1])
+    return snap.get("data_date"), snap.get("columns", []), snap.get("rows", [])
+
+
+def fetch_csv(
+    url: str, encoding: Optional[str] = None, headers: Optional[Dict[str, str]] = None
+) -> Tuple[Optional[pd.DataFrame], Optional[Dict[str, str]]]:
+    # 直接把回應的 byte stream 交給 pandas 的 C parser，不先組成整段字串
+    with _SESSION.get(url, headers=headers, timeout=60, stream=True) as r:
+        if r.status_code == 304:
+            return None, None
         r.raise_for_status()
-        html = r.text
-        text = _html_text(html)
-        data_date = extract_date_from_text(text)
-        all_dfs = pd.read_html(html)
-        df = normalize_df(pick_holdings_table(all_dfs))
-
-    elif typ == "csv":
-        csv_text = fetch_csv(url)
-        from io import StringIO
-        df = pd.read_csv(StringIO(csv_text))
-        df = normalize_df(df)
-        data_date = None
-
-    else:
-        raise ValueError(f"Unknown source type: {typ}")
-
-    rows = df.to_dict(orient="records")
-    return data_date, list(df.columns), rows
-
-    elif typ == "html":
-        r = requests.get(url, headers={"User-Agent": UA}, timeout=60)
-        r.raise_for_status()
-        html = r.text
-        text = _html_text(html)
-        data_date = extract_date_from_text(text)
-        all_dfs = pd.read_html(html)
-        df = normalize_df(pick_holdings_table(all_dfs))
-
-    elif typ == "csv":
-        csv_text = fetch_csv(url)
-        from io import StringIO
-        df = pd.read_csv(StringIO(csv_text))
-        df = normalize_df(df)
-        data_date = None
-
-    else:
-        raise ValueError(f"Unknown source type: {typ}")
-
-    rows = df.to_dict(orient="records")
-    return data_date, list(df.columns), rows
-
-
-def fetch_csv(url: str) -> str:
-    r = requests.get(url, headers={"User-Agent": UA}, timeout=60)
-    r.raise_for_status()
-    return r.text
-
-
-def fetch_holdings_from_source(cfg: Dict[str, Any]) -> Tuple[Optional[str], List[str], List[Dict[str, Any]]]:
+        if encoding is None:
+            # 沒指定 encoding 時只採用伺服器明確宣告的 charset（不用 requests 對 text/* 預設的 ISO-8859-1）
+            m = _CHARSET_RE.search(r.headers.get("Content-Type", ""))
+            encoding = m.group(1) if m else None
+        r.raw.decode_content = True
+        # pandas 不會依 encoding 解碼 urllib3 的原始串流，非預設編碼時自行包一層
+        # （auto_close=False：讀完時串流不自動關閉，TextIOWrapper 才能正常收尾）
+        r.raw.auto_close = False
+        src = r.raw if encoding is None else TextIOWrapper(r.raw, encoding=encoding, newline="")
+        return pd.read_csv(src, dtype=str, engine="c"), response_validators(r)
+
+
+def head_validators(url: str, headers: Dict[str, str]) -> Tuple[bool, Optional[Dict[str, str]]]:
+    # playwright_html 先送 HEAD；回傳 (是否未變動, 新的 validators；None 表示沿用既有快取)
+    try:
+        r = _SESSION.head(url, headers=headers, timeout=30, allow_redirects=True)
+    except requests.RequestException:
+        return False, None
+    if r.status_code == 304:
+        return True, None
+    return False, response_validators(r) if r.ok else {}
+
+
+async def fetch_holdings_from_source(
+    code: str, cfg: Dict[str, Any], context: Optional[BrowserContext] = None
+) -> Tuple[Optional[str], List[str], List[Dict[str, Any]], Optional[Dict[str, str]]]:
+    # 回傳的最後一項是來源的 ETag/Last-Modified，寫檔成功後才存進 CACHE_DIR；
+    # 空 dict 表示來源不再提供（刪除快取），None 表示維持既有快取
     typ = cfg.get("type", "playwright_html")
     url = cfg["url"]
 
     if typ == "playwright_html":
-        html = render_html_playwright(url)
-        text = _html_text(html)
-        data_date = extract_date_from_text(text)
-        dfs = pd.read_html(html)
-        df = normalize_df(pick_holdings_table(dfs))
+        if context is None:
+            raise RuntimeError("playwright_html source requires a browser context")
+        # JS 渲染頁的外殼 HTML 不變不代表持股沒變，需在 sources.json 以 "conditional": true 開啟
+        validators: Optional[Dict[str, str]] = None
+        if cfg.get("conditional", False):
+            unchanged, validators = await asyncio.to_thread(head_validators, url, conditional_headers(code, url))
+            if unchanged:
+                return (*load_latest_snapshot(code), None)
+        html = await render_html_playwright(
+            context,
+            url,
+            expand=bool(cfg.get("expand", True)),
+            ready_selector=cfg.get("ready_selector"),
+            tables_only=not cfg.get("table_selector"),
+        )
+        data_date, columns, rows = parse_html_source(html, cfg)
     elif typ == "html":
-        r = requests.get(url, headers={"User-Agent": UA}, timeout=60)
+        r = await asyncio.to_thread(_SESSION.get, url, headers=conditional_headers(code, url), timeout=60)
+        if r.status_code == 304:
+            return (*load_latest_snapshot(code), None)
         r.raise_for_status()
-        html = r.text
-        text = _html_text(html)
-        data_date = extract_date_from_text(text)
-        dfs = pd.read_html(html)
-        df = normalize_df(pick_holdings_table(dfs))
+        validators = response_validators(r)
+        data_date, columns, rows = parse_html_source(r.text, cfg)
     elif typ == "csv":
-        csv_text = fetch_csv(url)
-        from io import StringIO
-        df = pd.read_csv(StringIO(csv_text))
+        df, validators = await asyncio.to_thread(fetch_csv, url, cfg.get("encoding"), conditional_headers(code, url))
+        if df is None:
+            return (*load_latest_snapshot(code), None)
         df = normalize_df(df)
         data_date = None
+        columns, rows = list(df.columns), df.to_dict(orient="records")
     else:
         raise ValueError(f"Unknown source type: {typ}")
 
-    rows = df.to_dict(orient="records")
-    return data_date, list(df.columns), rows
+    return data_date, columns, rows, validators
 
 
-def detect_columns(columns: List[str]) -> Dict[str, Optional[str]]:
-    # 對齊用 key：優先代號，其次名稱
-    code_cols = ["股票代號", "證券代號", "代號", "代碼", "Ticker", "Symbol"]
-    name_cols = ["股票名稱", "證券名稱", "名稱", "Name", "Security"]
-    weight_cols = ["比重(%)", "比重", "權重(%)", "權重", "Weight", "持股權重"]
-    shares_cols = ["股數", "持有股數", "持股股數", "Shares", "Units", "數量"]
+@functools.lru_cache(maxsize=256)
+def detect_columns(columns: Tuple[str, ...]) -> Dict[str, Optional[str]]:
+    # 對齊用 key：優先代號，其次名稱（結果有快取且共用，請勿修改）
+    cols_set = set(columns)
+    cols_lower = [c.lower() for c in columns]
 
-    def pick(cands):
-        for c in cands:
-            if c in columns:
-                return c
+    def pick(field: str) -> Optional[str]:
+        c = next((k for k in COLUMN_CANDIDATES[field] if k in cols_set), None)
+        if c is not None:
+            return c
         # fuzzy contains
-        for c in columns:
-            for k in cands:
-                if k.lower().replace("(%)","") in c.lower():
+        for c, cl in zip(columns, cols_lower):
+            for k in _COLUMN_CANDIDATES_LOWER[field]:
+                if k in cl:
                     return c
         return None
 
-    return {
-        "code": pick(code_cols),
-        "name": pick(name_cols),
-        "weight": pick(weight_cols),
-        "shares": pick(shares_cols),
-    }
+    return {field: pick(field) for field in COLUMN_CANDIDATES}
 
 
 def to_float(x) -> Optional[float]:
@@ -281,94 +523,116 @@ def to_int(x) -> Optional[int]:
         return None
 
 
-def build_map(rows: List[Dict[str, Any]], cols: Dict[str, Optional[str]]) -> Dict[str, Dict[str, Any]]:
-    m = {}
-    for r in rows:
-        key = None
-        if cols["code"] and r.get(cols["code"]) not in (None, ""):
-            key = str(r.get(cols["code"])).strip()
-        elif cols["name"] and r.get(cols["name"]) not in (None, ""):
-            key = str(r.get(cols["name"])).strip()
-        else:
-            continue
+def _str_col(df: pd.DataFrame, col: Optional[str]) -> pd.Series:
+    # 欄位不存在時回傳全為 NA 的欄，讓後續運算不必分支
+    if not col or col not in df.columns:
+        return pd.Series(pd.NA, index=df.index, dtype="string")
+    return df[col].astype("string").str.strip()
 
-        item = {
-            "key": key,
-            "code": str(r.get(cols["code"])).strip() if cols["code"] and r.get(cols["code"]) is not None else None,
-            "name": str(r.get(cols["name"])).strip() if cols["name"] and r.get(cols["name"]) is not None else None,
-            "weight": to_float(r.get(cols["weight"])) if cols["weight"] else None,
-            "shares": to_int(r.get(cols["shares"])) if cols["shares"] else None,
-        }
-        m[key] = item
-    return m
 
+def _to_list(s: pd.Series) -> List[Any]:
+    return [None if pd.isna(x) else x for x in s.tolist()]
 
-def compute_changes(prev_payload: Dict[str, Any], curr_payload: Dict[str, Any]) -> Dict[str, Any]:
-    prev_rows = prev_payload.get("rows", [])
-    curr_rows = curr_payload.get("rows", [])
 
-    prev_cols = detect_columns(prev_payload.get("columns", []))
-    curr_cols = detect_columns(curr_payload.get("columns", []))
+def _mask_non_finite(s: pd.Series, bound: float = np.inf) -> pd.Series:
+    # inf/-inf（例如 "inf"、"1e400"）與超出 bound 的值視為缺值，避免轉型後變成垃圾數字
+    values = s.to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        return s.where(np.abs(values) < bound)
 
-    prev_map = build_map(prev_rows, prev_cols)
-    curr_map = build_map(curr_rows, curr_cols)
 
-    all_keys = sorted(set(prev_map.keys()) | set(curr_map.keys()))
+def build_map(df: pd.DataFrame, cols: Dict[str, Optional[str]]) -> pd.DataFrame:
+    # 整欄向量化轉換，回傳以 key 為 index 的 code/name/weight/shares
+    code = _str_col(df, cols["code"])
+    name = _str_col(df, cols["name"])
 
-    out_rows = []
-    summary = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    weight = (
+        _str_col(df, cols["weight"])
+        .str.replace(_WEIGHT_NOISE_RE, "", regex=True)
+        .pipe(pd.to_numeric, errors="coerce")
+        .astype("Float64")
+        .pipe(_mask_non_finite)
+    )
+    shares = (
+        _str_col(df, cols["shares"])
+        .str.replace(_SHARES_NOISE_RE, "", regex=True)
+        .pipe(pd.to_numeric, errors="coerce")
+        .astype("Float64")
+        .pipe(_mask_non_finite, bound=2.0**63)
+        .pipe(np.trunc)
+        .astype("Int64")
+    )
 
-    for k in all_keys:
-        p = prev_map.get(k)
-        c = curr_map.get(k)
+    # 對齊用 key：優先代號，其次名稱；兩者皆空則略過該列
+    has_code = code.fillna("") != ""
+    has_name = name.fillna("") != ""
+    key = code.where(has_code, name)
+    keep = has_code | has_name
 
-        status = None
-        if p is None and c is not None:
-            status = "新增"
-            summary["added"] += 1
-        elif p is not None and c is None:
-            status = "移除"
-            summary["removed"] += 1
-        else:
-            # both exist
-            dw = None
-            ds = None
-            if p.get("weight") is not None or c.get("weight") is not None:
-                dw = (c.get("weight") or 0.0) - (p.get("weight") or 0.0)
-            if p.get("shares") is not None or c.get("shares") is not None:
-                ds = (c.get("shares") or 0) - (p.get("shares") or 0)
-
-            # decide changed/unchanged
-            if (dw is not None and abs(dw) > 1e-9) or (ds is not None and ds != 0):
-                status = "變動"
-                summary["changed"] += 1
-            else:
-                status = "不變"
-                summary["unchanged"] += 1
-
-        out_rows.append({
-            "狀態": status,
-            "代號": (c or p).get("code"),
-            "名稱": (c or p).get("name"),
-            "權重_今日(%)": (c or {}).get("weight"),
-            "權重_前日(%)": (p or {}).get("weight"),
-            "權重差(%)": (
-                ((c or {}).get("weight") or 0.0) - ((p or {}).get("weight") or 0.0)
-                if ((c or {}).get("weight") is not None or (p or {}).get("weight") is not None)
-                else None
-            ),
-            "股數_今日": (c or {}).get("shares"),
-            "股數_前日": (p or {}).get("shares"),
-            "股數差": (
-                ((c or {}).get("shares") or 0) - ((p or {}).get("shares") or 0)
-                if ((c or {}).get("shares") is not None or (p or {}).get("shares") is not None)
-                else None
-            )
-        })
+    m = pd.DataFrame({"key": key, "code": code, "name": name, "weight": weight, "shares": shares})[keep]
+    # 同一 key 出現多次時以最後一列為準
+    return m.drop_duplicates("key", keep="last").set_index("key")
+
+
+def resolve_columns(columns: List[str], column_map: Optional[Dict[str, Optional[str]]]) -> Dict[str, Optional[str]]:
+    # 有指定的欄位用 column_map，其餘以 detect_columns 補上
+    detected = detect_columns(tuple(columns))
+    if not column_map:
+        return detected
+    return {field: column_map.get(field) or detected[field] for field in detected}
+
+
+def compute_changes(prev_payload: Dict[str, Any], curr_payload: Dict[str, Any]) -> Dict[str, Any]:
+    prev_columns = prev_payload.get("columns", [])
+    curr_columns = curr_payload.get("columns", [])
+
+    prev_cols = resolve_columns(prev_columns, prev_payload.get("column_map"))
+    curr_cols = resolve_columns(curr_columns, curr_payload.get("column_map"))
+
+    prev_map = build_map(pd.DataFrame(prev_payload.get("rows", []), columns=prev_columns, dtype=object), prev_cols)
+    curr_map = build_map(pd.DataFrame(curr_payload.get("rows", []), columns=curr_columns, dtype=object), curr_cols)
+
+    merged = prev_map.join(curr_map, how="outer", lsuffix="_p", rsuffix="_c").sort_index()
+    in_p = merged.index.isin(prev_map.index)
+    in_c = merged.index.isin(curr_map.index)
+
+    cw, pw = merged["weight_c"], merged["weight_p"]
+    cs, ps = merged["shares_c"], merged["shares_p"]
+    # 任一邊有值才算差額，缺值以 0 計
+    dw = (cw.fillna(0.0) - pw.fillna(0.0)).mask(cw.isna() & pw.isna())
+    ds = (cs.fillna(0) - ps.fillna(0)).mask(cs.isna() & ps.isna())
+    changed = (dw.abs() > 1e-9).fillna(False) | (ds != 0).fillna(False)
+
+    status = np.select([~in_p, ~in_c, changed.to_numpy(dtype=bool)], ["新增", "移除", "變動"], default="不變")
+    summary = {
+        "added": int((~in_p).sum()),
+        "removed": int((in_p & ~in_c).sum()),
+        "changed": int((status == "變動").sum()),
+        "unchanged": int((status == "不變").sum()),
+    }
+
+    out = pd.DataFrame({
+        "狀態": status,
+        "代號": merged["code_c"].where(in_c, merged["code_p"]),
+        "名稱": merged["name_c"].where(in_c, merged["name_p"]),
+        "權重_今日(%)": cw,
+        "權重_前日(%)": pw,
+        "權重差(%)": dw,
+        "股數_今日": cs,
+        "股數_前日": ps,
+        "股數差": ds,
+    }, index=merged.index)
 
     # Nice ordering: 新增/移除/變動/不變
     order = {"新增": 0, "移除": 1, "變動": 2, "不變": 3}
-    out_rows.sort(key=lambda r: (order.get(r["狀態"], 9), str(r.get("代號") or ""), str(r.get("名稱") or "")))
+    sort_keys = pd.DataFrame({
+        "order": out["狀態"].map(order),
+        "code": out["代號"].fillna(""),
+        "name": out["名稱"].fillna(""),
+    }, index=out.index)
+    out = out.loc[sort_keys.sort_values(["order", "code", "name"], kind="stable").index]
+
+    out_rows = [dict(zip(out.columns, vals)) for vals in zip(*(_to_list(out[c]) for c in out.columns))]
 
     return {
         "base_date": curr_payload.get("snapshot_date"),
@@ -379,25 +643,150 @@ def compute_changes(prev_payload: Dict[str, Any], curr_payload: Dict[str, Any])
     }
 
 
-def list_snapshots(code: str) -> List[str]:
+def list_snapshots(code: str, limit: Optional[int] = None) -> List[str]:
+    # 依日期由舊到新；給 limit 時只取最新的 limit 份
     d = os.path.join(OUT_SNAP_DIR, code)
     if not os.path.isdir(d):
         return []
-    files = [f for f in os.listdir(d) if f.endswith(".json")]
+    with os.scandir(d) as it:
+        files = [e.name for e in it if e.name.endswith(".json") and e.is_file()]
     # filenames are YYYY-MM-DD.json
-    files.sort()
+    if limit is None:
+        files.sort()
+    else:
+        files = heapq.nlargest(limit, files)[::-1]
     return [os.path.join(d, f) for f in files]
 
 
 def load_json(path: str) -> Dict[str, Any]:
+    if orjson is not None:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
+@functools.lru_cache(maxsize=32)
+def _load_snapshot_cached(path: str, mtime_ns: int) -> Dict[str, Any]:
+    return load_json(path)
+
+
+def load_snapshot(path: str) -> Dict[str, Any]:
+    # 以 path + mtime 快取已解碼的快照（回傳值共用，請勿修改）
+    return _load_snapshot_cached(path, os.stat(path).st_mtime_ns)
+
+
 def save_json(path: str, payload: Dict[str, Any]) -> None:
+    # 先寫到 .tmp 再 os.replace，讀取端不會看到寫到一半的檔案
     ensure_dir(os.path.dirname(path))
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(payload, f, ensure_ascii=False, indent=2)
+    tmp = f"{path}.tmp"
+    if orjson is not None:
+        with open(tmp, "wb", buffering=1 << 20) as f:
+            f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(tmp, "w", encoding="utf-8", buffering=1 << 20) as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    # 以硬連結取代再寫一次同樣的 JSON；檔案系統不支援時退回複製
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    ensure_dir(os.path.dirname(dst))
+    tmp = f"{dst}.tmp"
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def write_source(
+    code: str,
+    cfg: Dict[str, Any],
+    data_date: Optional[str],
+    columns: List[str],
+    rows: List[Dict[str, Any]],
+    now_iso: str,
+    today_iso: str,
+) -> None:
+    # now_iso/today_iso 由 main() 取一次，所有來源共用同一個時間
+    snapshot_date = None
+    if data_date:
+        # normalize YYYY/MM/DD -> YYYY-MM-DD
+        snapshot_date = data_date.replace("/", "-")
+    else:
+        snapshot_date = today_iso
+
+    curr_payload = {
+        "code": code,
+        "source_url": cfg["url"],
+        "data_date": data_date,
+        "snapshot_date": snapshot_date,
+        "scraped_at": now_iso,
+        "columns": columns,
+        "rows": rows
+    }
+    column_map = column_map_from_cfg(cfg)
+    if column_map:
+        curr_payload["column_map"] = column_map
+
+    # write snapshot (keeps history; overwrite if same day re-run)
+    snap_path = os.path.join(OUT_SNAP_DIR, code, f"{snapshot_date}.json")
+    first_snapshot = not os.path.isdir(os.path.dirname(snap_path))
+    save_json(snap_path, curr_payload)
+
+    # write current（內容與快照相同，直接連結過去）
+    link_or_copy(snap_path, os.path.join(OUT_CURRENT_DIR, f"{code}.json"))
+
+    # compute changes from previous snapshot (if exists)
+    snaps = [] if first_snapshot else list_snapshots(code, limit=2)
+    if len(snaps) >= 2:
+        # 剛寫入的快照就是最新一份時直接用記憶體中的 payload，只需讀前一份
+        if snaps[-1] == snap_path:
+            curr = curr_payload
+        else:
+            curr = load_snapshot(snaps[-1])
+        prev = load_snapshot(snaps[-2])
+        changes = compute_changes(prev, curr)
+        save_json(os.path.join(OUT_CHANGES_DIR, f"{code}.json"), changes)
+    else:
+        save_json(os.path.join(OUT_CHANGES_DIR, f"{code}.json"), {
+            "base_date": snapshot_date,
+            "compare_date": None,
+            "summary": {"added": 0, "removed": 0, "changed": 0, "unchanged": 0},
+            "columns": ["提示"],
+            "rows": [{"提示": "尚無變動資料（需要至少兩天快照）"}]
+        })
+
+
+async def fetch_all_sources(sources: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    # 共用同一個 browser context，以 semaphore 限制同時開啟的分頁數
+    sem = asyncio.Semaphore(MAX_CONCURRENT_PAGES)
+
+    async def gather_all(context: Optional[BrowserContext]) -> List[Any]:
+        async def run(code: str, cfg: Dict[str, Any]):
+            async with sem:
+                return await fetch_holdings_from_source(code, cfg, context)
+
+        return await asyncio.gather(*(run(code, cfg) for code, cfg in sources.items()), return_exceptions=True)
+
+    # 只有 html/csv 來源時不啟動 Chromium
+    if not any(cfg.get("type", "playwright_html") == "playwright_html" for cfg in sources.values()):
+        return dict(zip(sources.keys(), await gather_all(None)))
+
+    async with async_playwright() as p:
+        browser, context = await launch_browser(p)
+        try:
+            results = await gather_all(context)
+        finally:
+            await context.close()
+            await browser.close()
+
+    return dict(zip(sources.keys(), results))
 
 
 def main():
@@ -405,57 +794,28 @@ def main():
     ensure_dir(OUT_CHANGES_DIR)
     ensure_dir(OUT_SNAP_DIR)
 
-    with open(SOURCES_PATH, "r", encoding="utf-8") as f:
-        sources = json.load(f)
+    sources = load_json(SOURCES_PATH)
 
-    idx = {"codes": sorted(list(sources.keys())), "generated_at": datetime.now(TZ).isoformat()}
+    now = datetime.now(TZ)
+    now_iso = now.isoformat()
+    today_iso = now.date().isoformat()
 
-    for code, cfg in sources.items():
-        data_date, columns, rows = fetch_holdings_from_source(cfg)
+    idx = {"codes": sorted(list(sources.keys())), "generated_at": now_iso}
 
-        snapshot_date = None
-        if data_date:
-            # normalize YYYY/MM/DD -> YYYY-MM-DD
-            snapshot_date = data_date.replace("/", "-")
-        else:
-            snapshot_date = datetime.now(TZ).date().isoformat()
-
-        curr_payload = {
-            "code": code,
-            "source_url": cfg["url"],
-            "data_date": data_date,
-            "snapshot_date": snapshot_date,
-            "scraped_at": datetime.now(TZ).isoformat(),
-            "columns": columns,
-            "rows": rows
-        }
-
-        # write current
-        save_json(os.path.join(OUT_CURRENT_DIR, f"{code}.json"), curr_payload)
+    results = asyncio.run(fetch_all_sources(sources))
 
-        # write snapshot (keeps history)
-        snap_path = os.path.join(OUT_SNAP_DIR, code, f"{snapshot_date}.json")
-        if not os.path.exists(snap_path):
-            save_json(snap_path, curr_payload)
-        else:
-            # overwrite if same day re-run
-            save_json(snap_path, curr_payload)
-
-        # compute changes from previous snapshot (if exists)
-        snaps = list_snapshots(code)
-        if len(snaps) >= 2:
-            prev = load_json(snaps[-2])
-            curr = load_json(snaps[-1])
-            changes = compute_changes(prev, curr)
-            save_json(os.path.join(OUT_CHANGES_DIR, f"{code}.json"), changes)
-        else:
-            save_json(os.path.join(OUT_CHANGES_DIR, f"{code}.json"), {
-                "base_date": snapshot_date,
-                "compare_date": None,
-                "summary": {"added": 0, "removed": 0, "changed": 0, "unchanged": 0},
-                "columns": ["提示"],
-                "rows": [{"提示": "尚無變動資料（需要至少兩天快照）"}]
-            })
+    # 寫檔留在主執行緒、依 sources 順序進行；遇到第一個失敗的來源即中止
+    for code, cfg in sources.items():
+        res = results[code]
+        if isinstance(res, BaseException):
+            raise res
+        data_date, columns, rows, validators = res
+        write_source(code, cfg, data_date, columns, rows, now_iso, today_iso)
+        if validators:
+            save_json(validators_path(code), {**validators, "url": cfg["url"]})
+        elif validators is not None and os.path.exists(validators_path(code)):
+            # 來源不再回 ETag/Last-Modified，舊的快取不能再拿來送條件式請求
+            os.remove(validators_path(code))
 
     # write index
     save_json(os.path.join(OUT_CURRENT_DIR, "index.json"), idx)